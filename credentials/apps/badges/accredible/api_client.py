@@ -23,16 +23,17 @@ class AccredibleAPIClient(BaseBadgeProviderClient):
 
     PROVIDER_NAME = "Accredible"
 
-    def __init__(self, api_config_id: int):
+    def __init__(self, api_config_id: int, api_config: AccredibleAPIConfig = None):
         """
         Initializes a AccredibleAPIClient object.
 
         Args:
-            api_config (AccredibleAPIConfig): Configuration object for the Accredible API.
+            api_config_id (int): ID of the configuration object for the Accredible API.
+            api_config (AccredibleAPIConfig): optional already loaded configuration object.
         """
 
         self.api_config_id = api_config_id
-        self.api_config = self.get_api_config()
+        self.api_config = api_config or self.get_api_config()
 
     def get_api_config(self) -> AccredibleAPIConfig:
         """
@@ -69,14 +70,14 @@ class AccredibleAPIClient(BaseBadgeProviderClient):
         design_raw = self.perform_request("get", f"designs/{design_id}")
         return design_raw.get("design", {}).get("rasterized_content_url")
 
-    def issue_badge(self, issue_badge_data: AccredibleBadgeData) -> dict:
+    def issue_badge(self, issue_badge_data: AccredibleBadgeData | dict) -> dict:
         """
         Issues a badge using the Accredible REST API.
 
         Args:
-            issue_badge_data (IssueBadgeData): Data required to issue the badge.
+            issue_badge_data (AccredibleBadgeData | dict): Data (or prebuilt payload) required to issue the badge.
         """
-        return self.perform_request("post", "credentials", asdict(issue_badge_data))
+        return self.perform_request("post", "credentials", self._as_payload(issue_badge_data))
 
     def revoke_badge(self, badge_id, data: AccredibleExpireBadgeData) -> dict:
         """
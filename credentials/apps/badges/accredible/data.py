@@ -54,6 +54,25 @@ class AccredibleBadgeData:
 
     credential: AccredibleCredential
 
+    @classmethod
+    def build_payload(cls, *, user, group, issued_on):
+        """
+        Returns the nested credential/recipient issuing payload for the user, skipping the data classes.
+        """
+
+        return {
+            "credential": {
+                "recipient": {
+                    "name": user.get_full_name() or user.username,
+                    "email": user.email,
+                },
+                "group_id": group.id,
+                "name": group.name,
+                "issued_on": issued_on,
+                "complete": True,
+            }
+        }
+
 
 @attr.s(auto_attribs=True, frozen=True)
 class AccredibleExpireBadgeData:
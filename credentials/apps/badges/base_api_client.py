@@ -1,8 +1,12 @@
 import logging
+import threading
 from abc import ABC, abstractmethod
+from http.cookiejar import DefaultCookiePolicy
 from urllib.parse import urljoin
 
 import requests
+from attrs import asdict
+from requests.adapters import HTTPAdapter
 from requests.exceptions import HTTPError
 
 from .exceptions import BadgeProviderError
@@ -10,6 +14,29 @@ from .exceptions import BadgeProviderError
 
 logger = logging.getLogger(__name__)
 
+REQUESTS_POOL_SIZE = 32
+
+_thread_local = threading.local()
+
+
+def get_requests_session():
+    """
+    Returns the HTTP session shared by badge provider clients within the current thread.
+
+    Its connection pool keeps provider connections alive, so consecutive API calls skip the TCP/TLS handshakes.
+    Sessions are not shared between threads, and they never store cookies, so no state leaks between providers,
+    organizations or API configurations.
+    """
+    session = getattr(_thread_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        adapter = HTTPAdapter(pool_connections=REQUESTS_POOL_SIZE, pool_maxsize=REQUESTS_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _thread_local.session = session
+    return session
+
 
 class BaseBadgeProviderClient(ABC):
     """
@@ -43,12 +70,19 @@ class BaseBadgeProviderClient(ABC):
         """
         url = urljoin(self.base_api_url, url_suffix)
         logger.debug(f"{self.PROVIDER_NAME} API: {method.upper()} {url}")
-        response = requests.request(
+        response = get_requests_session().request(
             method.upper(), url, headers=self._get_headers(), json=data, timeout=self.REQUESTS_TIMEOUT
         )
         self._raise_for_error(response)
         return response.json()
 
+    @staticmethod
+    def _as_payload(data):
+        """
+        Returns request payload for the given data: either an already built dict, or an attrs data instance.
+        """
+        return data if isinstance(data, dict) else asdict(data)
+
     def _raise_for_error(self, response):
         """
         Raises a CredlyAPIError if the response status code indicates an error.
@@ -89,7 +123,7 @@ class BaseBadgeProviderClient(ABC):
         Issues a badge using the badge provider API.
 
         Args:
-            issue_badge_data (dict): Data required to issue the badge.
+            issue_badge_data (attrs instance | dict): Data (or prebuilt payload) required to issue the badge.
         """
 
     @abstractmethod
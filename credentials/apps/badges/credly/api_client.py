@@ -4,7 +4,6 @@ from functools import lru_cache
 from urllib.parse import urljoin
 
 import requests  # pylint: disable=unused-import
-from attrs import asdict
 from django.conf import settings
 from django.contrib.sites.models import Site
 
@@ -102,9 +101,9 @@ class CredlyAPIClient(BaseBadgeProviderClient):
         Issues a badge using the Credly REST API.
 
         Args:
-            issue_badge_data (IssueBadgeData): Data required to issue the badge.
+            issue_badge_data (CredlyBadgeData | dict): Data (or prebuilt payload) required to issue the badge.
         """
-        return self.perform_request("post", "badges/", asdict(issue_badge_data))
+        return self.perform_request("post", "badges/", self._as_payload(issue_badge_data))
 
     def revoke_badge(self, badge_id, data=None):
         """
@@ -23,3 +23,17 @@ class CredlyBadgeData:
     issued_to_last_name: str
     badge_template_id: str
     issued_at: datetime
+
+    @classmethod
+    def build_payload(cls, *, user, badge_template, issued_at):
+        """
+        Returns the issuing request payload for the user as a plain dict keyed by CredlyBadgeData fields.
+        """
+
+        return {
+            "recipient_email": user.email,
+            "issued_to_first_name": user.first_name or user.username,
+            "issued_to_last_name": user.last_name or user.username,
+            "badge_template_id": str(badge_template.uuid),
+            "issued_at": issued_at,
+        }
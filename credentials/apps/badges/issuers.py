@@ -2,19 +2,21 @@
 This module provides classes for issuing badge credentials to users.
 """
 
+import logging
 from datetime import datetime
+from functools import partial
 
 from django.contrib.contenttypes.models import ContentType
 from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.translation import gettext as _
 
 from credentials.apps.badges.accredible.api_client import AccredibleAPIClient
 from credentials.apps.badges.accredible.data import (
     AccredibleBadgeData,
-    AccredibleCredential,
     AccredibleExpireBadgeData,
     AccredibleExpiredCredential,
-    AccredibleRecipient,
 )
 from credentials.apps.badges.credly.api_client import CredlyAPIClient
 from credentials.apps.badges.credly.data import CredlyBadgeData
@@ -28,15 +30,23 @@ from credentials.apps.badges.models import (
     UserCredential,
 )
 from credentials.apps.badges.signals.signals import notify_badge_awarded, notify_badge_revoked
-from credentials.apps.core.api import get_user_by_username
+from credentials.apps.core.api import get_user_by_username, get_users_by_usernames
 from credentials.apps.credentials.constants import UserCredentialStatus
 from credentials.apps.credentials.issuers import AbstractCredentialIssuer
 
 
-REVOCATION_STATES = {
-    CredlyBadge: CredlyBadge.STATES.revoked,
-    AccredibleBadge: AccredibleBadge.STATES.expired,
-}
+logger = logging.getLogger(__name__)
+
+
+def _format_datetime(value):
+    """
+    Formats a datetime the way badge providers expect it ("%Y-%m-%d %H:%M:%S %z").
+
+    Built on top of the C-implemented isoformat() instead of parsing the strftime format string on every call.
+    """
+
+    iso_value = value.isoformat(sep=" ", timespec="seconds")
+    return f"{iso_value[:19]} {iso_value[19:].replace(':', '')}"
 
 
 class BadgeTemplateIssuer(AbstractCredentialIssuer):
@@ -46,13 +56,24 @@ class BadgeTemplateIssuer(AbstractCredentialIssuer):
 
     issued_credential_type = BadgeTemplate
     issued_user_credential_type = UserCredential
+    select_related_fields = ()
+    revocation_state = None
+    # names of the external (badge provider) issuing and revoking methods, called with the user credential once the
+    # transaction is committed; resolved by name, so subclasses may override the provider methods themselves
+    external_issue_method = None
+    external_revoke_method = None
+    # user credential field that stores the external (badge provider) badge identifier
+    external_id_field = None
+
+    def __init__(self):
+        self._credential_ct = ContentType.objects.get_for_model(self.issued_credential_type)
 
     def get_credential(self, credential_id):
         """
         Get credential by id.
         """
 
-        return self.issued_credential_type.objects.get(id=credential_id)
+        return self.issued_credential_type.objects.select_related(*self.select_related_fields).get(id=credential_id)
 
     @transaction.atomic
     def issue_credential(
@@ -82,29 +103,99 @@ class BadgeTemplateIssuer(AbstractCredentialIssuer):
             UserCredential
         """
 
-        user_credential, __ = self.issued_user_credential_type.objects.get_or_create(
+        user_credential, created = self.issued_user_credential_type.objects.get_or_create(
             username=username,
-            credential_content_type=ContentType.objects.get_for_model(credential),
+            credential_content_type=self._credential_ct,
             credential_id=credential.id,
             defaults={
                 "status": status,
             },
         )
-        if not user_credential.state == REVOCATION_STATES.get(self.issued_user_credential_type):
+        # a freshly created record already carries the requested status; an existing one is written at most once,
+        # and never when its external badge has been revoked
+        updated = not created and user_credential.status != status and user_credential.state != self.revocation_state
+        if updated:
             user_credential.status = status
-            user_credential.save()
+            user_credential.save(update_fields=["status", "modified"])
+        # reuse the already loaded credential (with its related objects) instead of resolving the generic relation again
+        user_credential.credential = credential
+
+        # a freshly created record has neither attributes nor a date override yet, so there is nothing to add or clear
+        if created and attributes is None and date_override is None:
+            return user_credential
 
         self.set_credential_attributes(user_credential, attributes)
         self.set_credential_date_override(user_credential, date_override)
 
         return user_credential
 
+    @transaction.atomic
+    def bulk_issue_credential(self, credential, usernames, status=UserCredentialStatus.AWARDED):
+        """
+        Issue a credential to several users at once.
+
+        Existing user credentials are fetched with a single query and moved to the given status with a single UPDATE
+        (badges with a revoked external state are left untouched). Missing ones are created one by one.
+
+        Arguments:
+            credential (AbstractCredential): Type of credential to issue.
+            usernames (Iterable[str]): usernames of users for which credential required
+            status (str): status of credential
+
+        Returns:
+            List[UserCredential], in the order of the given usernames
+        """
+
+        usernames = list(dict.fromkeys(usernames))
+        manager = self.issued_user_credential_type.objects
+        user_credentials = {
+            user_credential.username: user_credential
+            for user_credential in manager.filter(
+                username__in=usernames,
+                credential_content_type=self._credential_ct,
+                credential_id=credential.id,
+            )
+        }
+
+        # multi-table inherited badge models cannot be bulk created; get_or_create picks up a record created by a
+        # concurrent award in between instead of failing (and rolling back) the whole batch
+        for username in usernames:
+            if username not in user_credentials:
+                user_credentials[username], _created = manager.get_or_create(
+                    username=username,
+                    credential_content_type=self._credential_ct,
+                    credential_id=credential.id,
+                    defaults={
+                        "status": status,
+                    },
+                )
+
+        outdated = [
+            user_credential
+            for user_credential in user_credentials.values()
+            if user_credential.status != status and user_credential.state != self.revocation_state
+        ]
+        if outdated:
+            now = timezone.now()
+            manager.filter(pk__in=[user_credential.pk for user_credential in outdated]).update(
+                status=status, modified=now
+            )
+            for user_credential in outdated:
+                user_credential.status = status
+                user_credential.modified = now
+
+        for user_credential in user_credentials.values():
+            user_credential.credential = credential
+
+        return [user_credentials[username] for username in usernames]
+
     def award(self, *, username, credential_id):
         """
         Awards a badge.
 
-        Creates user credential record for the given badge template, for a given user.
-        Notifies about the awarded badge (public signal).
+        - Creates user credential record for the given badge template, for a given user;
+        - Notifies about the awarded badge (public signal) once the current transaction is committed;
+        - Issues external badge (provider API) once the current transaction is committed;
 
         Returns: UserCredential
         """
@@ -112,15 +203,135 @@ class BadgeTemplateIssuer(AbstractCredentialIssuer):
         credential = self.get_credential(credential_id)
         user_credential = self.issue_credential(credential, username)
 
-        notify_badge_awarded(user_credential)
+        transaction.on_commit(partial(notify_badge_awarded, user_credential))
+
+        # do not issue new badges if the badge was issued already
+        if self.external_issue_method and not user_credential.propagated:
+            transaction.on_commit(partial(self.propagate_award, user_credential))
+
         return user_credential
 
+    def bulk_award(self, *, usernames, credential_id):
+        """
+        Awards a badge to several users.
+
+        - Resolves the users with a single query, skipping usernames without a user;
+        - Creates (or updates) user credential records for the given badge template in bulk;
+        - Notifies about each awarded badge (public signal) once the current transaction is committed;
+        - Issues external badges (provider API) in a single batch once the current transaction is committed;
+
+        Returns: List[UserCredential]
+        """
+
+        usernames = list(dict.fromkeys(usernames))
+        users = get_users_by_usernames(usernames)
+
+        unknown_usernames = [username for username in usernames if username not in users]
+        if unknown_usernames:
+            logger.warning(f"BADGES: skipping award of {credential_id} to unknown users: {unknown_usernames}")
+
+        credential = self.get_credential(credential_id)
+        user_credentials = self.bulk_issue_credential(
+            credential, [username for username in usernames if username in users]
+        )
+
+        for user_credential in user_credentials:
+            transaction.on_commit(partial(notify_badge_awarded, user_credential))
+
+        if self.external_issue_method:
+            unpropagated = [user_credential for user_credential in user_credentials if not user_credential.propagated]
+            if unpropagated:
+                transaction.on_commit(partial(self.propagate_badges, unpropagated, users=users))
+
+        return user_credentials
+
+    def _mark_error(self, user_credential):
+        """
+        Marks the user credential's external badge state as failed.
+
+        Written with a single-column UPDATE, so concurrent changes to the rest of the row are not overwritten.
+        """
+
+        user_credential.state = "error"
+        type(user_credential).objects.filter(pk=user_credential.pk).update(state=user_credential.state)
+
+    def exclude_revoked(self, user_credentials):
+        """
+        Filters out user credentials which are revoked by now.
+
+        External issuing runs after the transaction commit, so a revoke may have landed in between. The current
+        status is re-read with a single query for all given user credentials.
+        """
+
+        revoked_ids = set(
+            self.issued_user_credential_type.objects.filter(
+                pk__in=[user_credential.pk for user_credential in user_credentials],
+            )
+            .filter(Q(status=UserCredentialStatus.REVOKED) | Q(state=self.revocation_state))
+            .values_list("pk", flat=True)
+        )
+        return [user_credential for user_credential in user_credentials if user_credential.pk not in revoked_ids]
+
+    def propagate_award(self, user_credential):
+        """
+        Runs an external provider issuing call for the awarded user credential, unless it was revoked meanwhile.
+        """
+
+        if self.exclude_revoked([user_credential]):
+            getattr(self, self.external_issue_method)(user_credential=user_credential)
+
+    def propagate_badges(self, user_credentials, users=None):
+        """
+        Runs an external provider issuing call for each of the given user credentials, except the revoked ones.
+
+        Recipients are taken from `users` (username to User mapping) when already resolved, otherwise they are
+        resolved with a single query for the whole batch. The issued badges' external state is written back with a
+        single bulk update. It is still attempted when the batch is interrupted, so already issued badges keep their
+        provider identifiers; the interruption cause is re-raised even if that write fails too.
+        A provider failure for a single badge is logged and does not stop the rest of the batch.
+        """
+
+        user_credentials = self.exclude_revoked(user_credentials)
+        if users is None:
+            users = get_users_by_usernames(user_credential.username for user_credential in user_credentials)
+
+        issue = getattr(self, self.external_issue_method)
+        issued = []
+        try:
+            for user_credential in user_credentials:
+                try:
+                    issue(user_credential=user_credential, user=users.get(user_credential.username), save=False)
+                except BadgeProviderError:
+                    logger.exception(f"BADGES: failed to propagate user credential {user_credential.uuid}")
+                else:
+                    user_credential.modified = timezone.now()
+                    issued.append(user_credential)
+        except Exception:
+            try:
+                self._store_propagated(issued)
+            except Exception:
+                logger.exception("BADGES: failed to store the external state of already propagated badges")
+            raise
+
+        self._store_propagated(issued)
+
+    def _store_propagated(self, user_credentials):
+        """
+        Writes the external state of propagated user credentials back with a single bulk update.
+        """
+
+        if user_credentials:
+            self.issued_user_credential_type.objects.bulk_update(
+                user_credentials, [self.external_id_field, "state", "modified"], batch_size=500
+            )
+
     def revoke(self, credential_id, username):
         """
         Revokes a badge.
 
-        Changes user credential status to REVOKED, for a given user.
-        Notifies about the revoked badge (public signal).
+        - Changes user credential status to REVOKED, for a given user;
+        - Notifies about the revoked badge (public signal) once the current transaction is committed;
+        - Revokes external badge (provider API) once the current transaction is committed;
 
         Returns: UserCredential
         """
@@ -128,7 +339,12 @@ class BadgeTemplateIssuer(AbstractCredentialIssuer):
         credential = self.get_credential(credential_id)
         user_credential = self.issue_credential(credential, username, status=UserCredentialStatus.REVOKED)
 
-        notify_badge_revoked(user_credential)
+        transaction.on_commit(partial(notify_badge_revoked, user_credential))
+
+        if self.external_revoke_method and user_credential.propagated:
+            revoke = getattr(self, self.external_revoke_method)
+            transaction.on_commit(partial(revoke, user_credential=user_credential))
+
         return user_credential
 
 
@@ -139,89 +355,60 @@ class CredlyBadgeTemplateIssuer(BadgeTemplateIssuer):
 
     issued_credential_type = CredlyBadgeTemplate
     issued_user_credential_type = CredlyBadge
+    select_related_fields = ("organization",)
+    revocation_state = CredlyBadge.STATES.revoked
+    external_issue_method = "issue_credly_badge"
+    external_revoke_method = "revoke_credly_badge"
+    external_id_field = "external_uuid"
 
-    def issue_credly_badge(self, *, user_credential):
+    def issue_credly_badge(self, *, user_credential, user=None, save=True):
         """
         Requests Credly service for external badge issuing based on internal user credential (CredlyBadge).
+
+        The recipient may be passed in when it is already loaded (e.g. for a batch of badges).
+        With `save=False` the issued state is only set on the instance, so the caller can save a batch at once.
         """
 
-        user = get_user_by_username(user_credential.username)
+        if user is None:
+            user = get_user_by_username(user_credential.username)
         badge_template = user_credential.credential
 
-        credly_badge_data = CredlyBadgeData(
-            recipient_email=user.email,
-            issued_to_first_name=(user.first_name or user.username),
-            issued_to_last_name=(user.last_name or user.username),
-            badge_template_id=str(badge_template.uuid),
-            issued_at=badge_template.created.strftime("%Y-%m-%d %H:%M:%S %z"),
+        credly_badge_data = CredlyBadgeData.build_payload(
+            user=user,
+            badge_template=badge_template,
+            issued_at=_format_datetime(badge_template.created),
         )
 
         try:
-            credly_api = CredlyAPIClient(badge_template.organization.uuid)
+            credly_api = CredlyAPIClient(badge_template.organization.uuid, badge_template.organization.api_key)
             response = credly_api.issue_badge(credly_badge_data)
         except BadgeProviderError:
-            user_credential.state = "error"
-            user_credential.save()
+            self._mark_error(user_credential)
             raise
 
         user_credential.external_uuid = response.get("data").get("id")
         user_credential.state = response.get("data").get("state")
-        user_credential.save()
+        if save:
+            user_credential.save(update_fields=["external_uuid", "state", "modified"])
 
-    def revoke_credly_badge(self, credential_id, user_credential):
+    def revoke_credly_badge(self, user_credential):
         """
         Requests Credly service for external badge revoking based on internal user credential (CredlyBadge).
         """
 
-        credential = self.get_credential(credential_id)
-        credly_api = CredlyAPIClient(credential.organization.uuid)
+        organization = user_credential.credential.organization
+        credly_api = CredlyAPIClient(organization.uuid, organization.api_key)
         revoke_data = {
             "reason": _("Open edX internal user credential was revoked"),
         }
         try:
             response = credly_api.revoke_badge(user_credential.external_uuid, revoke_data)
         except BadgeProviderError:
-            user_credential.state = "error"
-            user_credential.save()
+            self._mark_error(user_credential)
             raise
 
         user_credential.state = response.get("data").get("state")
-        user_credential.save()
-
-    def award(self, *, username, credential_id):
-        """
-        Awards a Credly badge.
-
-        - Creates user credential record for the given badge template, for a given user;
-        - Notifies about the awarded badge (public signal);
-        - Issues external Credly badge (Credly API);
-
-        Returns: (CredlyBadge) user credential
-        """
-
-        credly_badge = super().award(username=username, credential_id=credential_id)
-
-        # do not issue new badges if the badge was issued already
-        if not credly_badge.propagated:
-            self.issue_credly_badge(user_credential=credly_badge)
-
-        return credly_badge
-
-    def revoke(self, credential_id, username):
-        """
-        Revokes a Credly badge.
-
-        - Changes user credential status to REVOKED, for a given user;
-        - Notifies about the revoked badge (public signal);
-        - Revokes external Credly badge (Credly API);
-
-        Returns: (CredlyBadge) user credential
-        """
-
-        user_credential = super().revoke(credential_id, username)
-        if user_credential.propagated:
-            self.revoke_credly_badge(credential_id, user_credential)
-        return user_credential
+        user_credential.save(update_fields=["state", "modified"])
 
 
 class AccredibleBadgeTemplateIssuer(BadgeTemplateIssuer):
@@ -231,92 +418,58 @@ class AccredibleBadgeTemplateIssuer(BadgeTemplateIssuer):
 
     issued_credential_type = AccredibleGroup
     issued_user_credential_type = AccredibleBadge
+    select_related_fields = ("api_config",)
+    revocation_state = AccredibleBadge.STATES.expired
+    external_issue_method = "issue_accredible_badge"
+    external_revoke_method = "revoke_accredible_badge"
+    external_id_field = "external_id"
 
-    def issue_accredible_badge(self, *, user_credential):
+    def issue_accredible_badge(self, *, user_credential, user=None, save=True):
         """
         Requests Accredible service for external badge issuing based on internal user credential (AccredibleBadge).
+
+        The recipient may be passed in when it is already loaded (e.g. for a batch of badges).
+        With `save=False` the issued state is only set on the instance, so the caller can save a batch at once.
         """
 
-        user = get_user_by_username(user_credential.username)
+        if user is None:
+            user = get_user_by_username(user_credential.username)
         group = user_credential.credential
 
-        accredible_badge_data = AccredibleBadgeData(
-            credential=AccredibleCredential(
-                recipient=AccredibleRecipient(
-                    name=user.get_full_name() or user.username,
-                    email=user.email,
-                ),
-                group_id=group.id,
-                name=group.name,
-                issued_on=user_credential.created.strftime("%Y-%m-%d %H:%M:%S %z"),
-                complete=True,
-            )
+        accredible_badge_data = AccredibleBadgeData.build_payload(
+            user=user,
+            group=group,
+            issued_on=_format_datetime(user_credential.created),
         )
 
         try:
-            accredible_api = AccredibleAPIClient(group.api_config.id)
+            accredible_api = AccredibleAPIClient(group.api_config.id, api_config=group.api_config)
             response = accredible_api.issue_badge(accredible_badge_data)
         except BadgeProviderError:
-            user_credential.state = "error"
-            user_credential.save()
+            self._mark_error(user_credential)
             raise
 
         user_credential.external_id = response.get("credential").get("id")
         user_credential.state = AccredibleBadge.STATES.accepted
-        user_credential.save()
+        if save:
+            user_credential.save(update_fields=["external_id", "state", "modified"])
 
-    def revoke_accredible_badge(self, credential_id, user_credential):
+    def revoke_accredible_badge(self, user_credential):
         """
         Requests Accredible service for external badge expiring based on internal user credential (AccredibleBadge).
         """
 
-        credential = self.get_credential(credential_id)
-        accredible_api_client = AccredibleAPIClient(credential.api_config.id)
+        api_config = user_credential.credential.api_config
+        accredible_api_client = AccredibleAPIClient(api_config.id, api_config=api_config)
         revoke_badge_data = AccredibleExpireBadgeData(
-            credential=AccredibleExpiredCredential(expired_on=datetime.now().strftime("%Y-%m-%d %H:%M:%S %z"))
+            credential=AccredibleExpiredCredential(expired_on=_format_datetime(datetime.now()))
         )
 
         try:
             accredible_api_client.revoke_badge(user_credential.external_id, revoke_badge_data)
         except BadgeProviderError:
-            user_credential.state = "error"
-            user_credential.save()
+            self._mark_error(user_credential)
             raise
 
         user_credential.state = AccredibleBadge.STATES.expired
-        user_credential.save()
-
-    def award(self, *, username, credential_id):
-        """
-        Awards a Accredible badge.
-
-        - Creates user credential record for the group, for a given user;
-        - Notifies about the awarded badge (public signal);
-        - Issues external Accredible badge (Accredible API);
-
-        Returns: (AccredibleBadge) user credential
-        """
-
-        accredible_badge = super().award(username=username, credential_id=credential_id)
-
-        # do not issue new badges if the badge was issued already
-        if not accredible_badge.propagated:
-            self.issue_accredible_badge(user_credential=accredible_badge)
-
-        return accredible_badge
-
-    def revoke(self, credential_id, username):
-        """
-        Revokes a Accredible badge.
-
-        - Changes user credential status to REVOKED, for a given user;
-        - Notifies about the revoked badge (public signal);
-        - Expire external Accredible badge (Accredible API);
-
-        Returns: (AccredibleBadge) user credential
-        """
-
-        user_credential = super().revoke(credential_id, username)
-        if user_credential.propagated:
-            self.revoke_accredible_badge(credential_id, user_credential)
-        return user_credential
+        user_credential.save(update_fields=["state", "modified"])
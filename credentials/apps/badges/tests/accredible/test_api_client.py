@@ -56,6 +56,18 @@ class AccredibleAPIClientTestCase(TestCase):
             mock_perform_request.assert_called_once_with("post", "credentials", asdict(self.badge_data))
             self.assertEqual(result, {"badge": "issued"})
 
+    def test_issue_badge_with_built_payload(self):
+        user = mock.Mock(email="test_name@test.com", username="test_user")
+        user.get_full_name.return_value = "Test name"
+        group = mock.Mock(id=123)
+        group.name = "Test Badge"
+        payload = AccredibleBadgeData.build_payload(user=user, group=group, issued_on="2021-01-01 00:00:00 +0000")
+        self.assertEqual(payload, asdict(self.badge_data))
+
+        with mock.patch.object(AccredibleAPIClient, "perform_request") as mock_perform_request:
+            self.api_client.issue_badge(payload)
+            mock_perform_request.assert_called_once_with("post", "credentials", asdict(self.badge_data))
+
     def test_revoke_badge(self):
         badge_id = 123
         with mock.patch.object(AccredibleAPIClient, "perform_request") as mock_perform_request:
@@ -1,15 +1,43 @@
+import threading
 from unittest import mock
 
+import requests
 from attrs import asdict
 from django.test import TestCase
 from faker import Faker
 from openedx_events.learning.data import BadgeData, BadgeTemplateData, UserData, UserPersonalData
+from requests.cookies import MockRequest, create_cookie
 
+from credentials.apps.badges.base_api_client import get_requests_session
 from credentials.apps.badges.credly.api_client import CredlyAPIClient
+from credentials.apps.badges.credly.data import CredlyBadgeData
 from credentials.apps.badges.credly.exceptions import CredlyError
 from credentials.apps.badges.models import BadgeTemplate, CredlyOrganization
 
 
+class RequestsSessionTestCase(TestCase):
+    def test_session_is_reused_within_thread(self):
+        self.assertIs(get_requests_session(), get_requests_session())
+
+    def test_session_is_not_shared_between_threads(self):
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(get_requests_session()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(sessions[0], get_requests_session())
+
+    def test_session_does_not_store_cookies(self):
+        session = get_requests_session()
+        request = requests.Request("GET", "https://api.credly.com/v1/").prepare()
+
+        session.cookies.set_cookie_if_ok(
+            create_cookie("tenant", "first", domain="api.credly.com"), MockRequest(request)
+        )
+
+        self.assertEqual(len(session.cookies), 0)
+
+
 class CredlyApiClientTestCase(TestCase):
     def setUp(self):
         fake = Faker()
@@ -44,7 +72,7 @@ class CredlyApiClientTestCase(TestCase):
             )
 
     def test_perform_request(self):
-        with mock.patch("credentials.apps.badges.credly.api_client.requests.request") as mock_request:
+        with mock.patch("credentials.apps.badges.base_api_client.requests.Session.request") as mock_request:
             mock_response = mock.Mock()
             mock_response.json.return_value = {"key": "value"}
             mock_request.return_value = mock_response
@@ -92,6 +120,25 @@ class CredlyApiClientTestCase(TestCase):
             mock_perform_request.assert_called_once_with("post", "badges/", asdict(issue_badge_data))
             self.assertEqual(result, {"badge": "issued"})
 
+    def test_issue_badge_with_built_payload(self):
+        user = mock.Mock(email="test_email@mail.com", username="test_user", first_name="", last_name="User")
+        badge_template = mock.Mock(uuid="a3a9a3d6-7c2b-4a69-9d8b-0b1d6a0d1b4e")
+        issue_badge_data = CredlyBadgeData(
+            recipient_email="test_email@mail.com",
+            issued_to_first_name="test_user",
+            issued_to_last_name="User",
+            badge_template_id="a3a9a3d6-7c2b-4a69-9d8b-0b1d6a0d1b4e",
+            issued_at="2021-01-01 00:00:00 +0000",
+        )
+        payload = CredlyBadgeData.build_payload(
+            user=user, badge_template=badge_template, issued_at="2021-01-01 00:00:00 +0000"
+        )
+        self.assertEqual(payload, asdict(issue_badge_data))
+
+        with mock.patch.object(CredlyAPIClient, "perform_request") as mock_perform_request:
+            self.api_client.issue_badge(payload)
+            mock_perform_request.assert_called_once_with("post", "badges/", asdict(issue_badge_data))
+
     def test_revoke_badge(self):
         badge_id = "badge123"
         data = {"data": "value"}
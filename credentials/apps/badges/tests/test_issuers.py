@@ -1,15 +1,24 @@
+from datetime import datetime, timedelta, timezone
 from unittest import mock
 from unittest.mock import patch
 
 import faker
+from attrs import asdict
 from django.contrib.auth import get_user_model
 from django.contrib.contenttypes.models import ContentType
+from django.db import DatabaseError
 from django.test import TestCase
 
 from credentials.apps.badges.accredible.api_client import AccredibleAPIClient
+from credentials.apps.badges.accredible.data import AccredibleBadgeData, AccredibleCredential, AccredibleRecipient
 from credentials.apps.badges.credly.api_client import CredlyAPIClient
+from credentials.apps.badges.credly.data import CredlyBadgeData
 from credentials.apps.badges.exceptions import BadgeProviderError
-from credentials.apps.badges.issuers import AccredibleBadgeTemplateIssuer, CredlyBadgeTemplateIssuer
+from credentials.apps.badges.issuers import (
+    AccredibleBadgeTemplateIssuer,
+    CredlyBadgeTemplateIssuer,
+    _format_datetime,
+)
 from credentials.apps.badges.models import (
     AccredibleAPIConfig,
     AccredibleBadge,
@@ -19,11 +28,22 @@ from credentials.apps.badges.models import (
     CredlyOrganization,
 )
 from credentials.apps.credentials.constants import UserCredentialStatus
+from credentials.apps.credentials.models import UserCredentialDateOverride
 
 
 User = get_user_model()
 
 
+class FormatDatetimeTestCase(TestCase):
+    def test_matches_strftime_format(self):
+        for value in (
+            datetime(2024, 5, 17, 9, 41, 3, 123456),
+            datetime(2024, 5, 17, 9, 41, 3, tzinfo=timezone.utc),
+            datetime(2024, 5, 17, 9, 41, 3, tzinfo=timezone(timedelta(hours=-5, minutes=-30))),
+        ):
+            self.assertEqual(_format_datetime(value), value.strftime("%Y-%m-%d %H:%M:%S %z"))
+
+
 class CredlyBadgeTemplateIssuerTestCase(TestCase):
     issued_credential_type = CredlyBadgeTemplate
     issued_user_credential_type = CredlyBadge
@@ -54,7 +74,8 @@ class CredlyBadgeTemplateIssuerTestCase(TestCase):
         with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded") as mock_notify_badge_awarded:
 
             with mock.patch.object(self.issuer, "issue_credly_badge") as mock_issue_credly_badge:
-                self.issuer().award(credential_id=self.badge_template.id, username="test_user")
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.issuer().award(credential_id=self.badge_template.id, username="test_user")
 
             mock_notify_badge_awarded.assert_called_once()
             mock_issue_credly_badge.assert_called_once()
@@ -81,7 +102,8 @@ class CredlyBadgeTemplateIssuerTestCase(TestCase):
 
         with mock.patch("credentials.apps.badges.issuers.notify_badge_revoked") as mock_notify_badge_revoked:
             with mock.patch.object(self.issuer, "revoke_credly_badge") as mock_revoke_credly_badge:
-                self.issuer().revoke(self.badge_template.id, "test_user")
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.issuer().revoke(self.badge_template.id, "test_user")
 
             mock_revoke_credly_badge.assert_called_once()
             mock_notify_badge_revoked.assert_called_once()
@@ -96,6 +118,223 @@ class CredlyBadgeTemplateIssuerTestCase(TestCase):
                 ).exists()
             )
 
+    def test_award_notifies_after_commit(self):
+        with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded") as mock_notify_badge_awarded:
+            with mock.patch.object(self.issuer, "issue_credly_badge"):
+                with self.captureOnCommitCallbacks(execute=True):
+                    user_credential = self.issuer().award(credential_id=self.badge_template.id, username="test_user")
+                    mock_notify_badge_awarded.assert_not_called()
+
+        mock_notify_badge_awarded.assert_called_once_with(user_credential)
+
+    def test_new_award_skips_attributes_and_date_override(self):
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+
+        with mock.patch.object(self.issuer, "set_credential_date_override") as mock_set_credential_date_override:
+            issuer.issue_credential(credential, "test_user")
+
+        mock_set_credential_date_override.assert_not_called()
+
+    def test_repeated_award_does_not_save(self):
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+        issuer.issue_credential(credential, "test_user")
+
+        with mock.patch.object(self.issuer, "set_credential_date_override") as mock_set_credential_date_override:
+            with mock.patch.object(self.issued_user_credential_type, "save") as mock_save:
+                user_credential = issuer.issue_credential(credential, "test_user")
+
+        mock_save.assert_not_called()
+        mock_set_credential_date_override.assert_called_once_with(user_credential, None)
+
+    def test_repeated_award_clears_date_override(self):
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+        user_credential = issuer.issue_credential(credential, "test_user")
+        UserCredentialDateOverride.objects.create(user_credential=user_credential, date=datetime.now(timezone.utc))
+
+        issuer.issue_credential(credential, "test_user")
+
+        self.assertFalse(UserCredentialDateOverride.objects.filter(user_credential=user_credential).exists())
+
+    def test_award_keeps_status_of_revoked_badge(self):
+        self.issued_user_credential_type.objects.create(
+            username="test_user",
+            credential_content_type=ContentType.objects.get_for_model(self.badge_template),
+            credential_id=self.badge_template.id,
+            status=UserCredentialStatus.REVOKED,
+            state=CredlyBadge.STATES.revoked,
+            uuid=self.fake.uuid4(),
+            external_uuid=self.fake.uuid4(),
+        )
+
+        with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded"):
+            user_credential = self.issuer().award(credential_id=self.badge_template.id, username="test_user")
+
+        user_credential.refresh_from_db()
+        self.assertEqual(user_credential.status, UserCredentialStatus.REVOKED)
+
+    def test_bulk_award(self):
+        User.objects.create_user(username="other_user", email="other_email@fff.com", password="test_password")
+        self.issued_user_credential_type.objects.create(
+            username="test_user",
+            credential_content_type=ContentType.objects.get_for_model(self.badge_template),
+            credential_id=self.badge_template.id,
+            status=UserCredentialStatus.REVOKED,
+            uuid=self.fake.uuid4(),
+        )
+
+        with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded") as mock_notify_badge_awarded:
+            with mock.patch.object(self.issuer, "issue_credly_badge") as mock_issue_credly_badge:
+                with self.captureOnCommitCallbacks(execute=True):
+                    user_credentials = self.issuer().bulk_award(
+                        usernames=["test_user", "other_user"], credential_id=self.badge_template.id
+                    )
+
+        self.assertEqual([badge.username for badge in user_credentials], ["test_user", "other_user"])
+        self.assertEqual(mock_notify_badge_awarded.call_count, 2)
+        self.assertEqual(mock_issue_credly_badge.call_count, 2)
+        self.assertEqual(
+            self.issued_user_credential_type.objects.filter(
+                credential_id=self.badge_template.id, status=UserCredentialStatus.AWARDED
+            ).count(),
+            2,
+        )
+
+    def test_award_skips_credly_badge_issuing_when_revoked_before_commit(self):
+        with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded"), mock.patch(
+            "credentials.apps.badges.issuers.notify_badge_revoked"
+        ):
+            with mock.patch.object(self.issuer, "issue_credly_badge") as mock_issue_credly_badge:
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.issuer().award(credential_id=self.badge_template.id, username="test_user")
+                    self.issuer().revoke(self.badge_template.id, "test_user")
+
+            mock_issue_credly_badge.assert_not_called()
+
+    def test_bulk_award_skips_unknown_users(self):
+        with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded") as mock_notify_badge_awarded:
+            with mock.patch.object(self.issuer, "issue_credly_badge") as mock_issue_credly_badge:
+                with self.captureOnCommitCallbacks(execute=True):
+                    user_credentials = self.issuer().bulk_award(
+                        usernames=["test_user", "unknown_user"], credential_id=self.badge_template.id
+                    )
+
+        self.assertEqual([badge.username for badge in user_credentials], ["test_user"])
+        mock_notify_badge_awarded.assert_called_once()
+        mock_issue_credly_badge.assert_called_once()
+        self.assertEqual(mock_issue_credly_badge.call_args.kwargs["user"].username, "test_user")
+        self.assertFalse(self.issued_user_credential_type.objects.filter(username="unknown_user").exists())
+
+    def test_bulk_issue_credential_picks_up_concurrently_created_badge(self):
+        User.objects.create_user(username="other_user", email="other_email@fff.com", password="test_password")
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+        manager = self.issued_user_credential_type.objects
+        # created by a concurrent award after the batch has looked up the existing badges
+        concurrent_badge = manager.create(
+            username="test_user",
+            credential_content_type=ContentType.objects.get_for_model(self.badge_template),
+            credential_id=self.badge_template.id,
+            status=UserCredentialStatus.AWARDED,
+        )
+        filter_ = manager.filter
+        stale_lookup = iter([True])
+
+        def filter_with_stale_lookup(*args, **kwargs):
+            if next(stale_lookup, False):
+                return manager.none()
+            return filter_(*args, **kwargs)
+
+        with mock.patch.object(manager, "filter", side_effect=filter_with_stale_lookup):
+            user_credentials = issuer.bulk_issue_credential(credential, ["test_user", "other_user"])
+
+        self.assertEqual([badge.username for badge in user_credentials], ["test_user", "other_user"])
+        self.assertEqual(user_credentials[0].pk, concurrent_badge.pk)
+        self.assertEqual(manager.filter(credential_id=self.badge_template.id).count(), 2)
+
+    def test_build_payload_matches_badge_data(self):
+        user = User.objects.get(username="test_user")
+        issued_at = _format_datetime(self.badge_template.created)
+
+        badge_data = CredlyBadgeData(
+            recipient_email=user.email,
+            issued_to_first_name=(user.first_name or user.username),
+            issued_to_last_name=(user.last_name or user.username),
+            badge_template_id=str(self.badge_template.uuid),
+            issued_at=issued_at,
+        )
+
+        self.assertEqual(
+            CredlyBadgeData.build_payload(user=user, badge_template=self.badge_template, issued_at=issued_at),
+            asdict(badge_data),
+        )
+
+    @patch.object(CredlyAPIClient, "perform_request", _perform_request)
+    def test_propagate_badges(self):
+        User.objects.create_user(username="other_user", email="other_email@fff.com", password="test_password")
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+        user_credentials = issuer.bulk_issue_credential(credential, ["test_user", "other_user"])
+
+        issuer.propagate_badges(user_credentials)
+
+        for user_credential in user_credentials:
+            user_credential.refresh_from_db()
+            self.assertIsNotNone(user_credential.external_uuid)
+            self.assertEqual(user_credential.state, "issued")
+
+    def test_propagate_badges_keeps_issued_badges_when_interrupted(self):
+        User.objects.create_user(username="other_user", email="other_email@fff.com", password="test_password")
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+        first, second = issuer.bulk_issue_credential(credential, ["test_user", "other_user"])
+        external_uuid = self.fake.uuid4()
+
+        with patch.object(
+            CredlyAPIClient,
+            "perform_request",
+            side_effect=[{"data": {"id": external_uuid, "state": "issued"}}, RuntimeError],
+        ):
+            with self.assertRaises(RuntimeError):
+                issuer.propagate_badges([first, second])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(str(first.external_uuid), external_uuid)
+        self.assertEqual(first.state, "issued")
+        self.assertIsNone(second.external_uuid)
+
+    def test_propagate_badges_reraises_interruption_when_store_fails(self):
+        User.objects.create_user(username="other_user", email="other_email@fff.com", password="test_password")
+        issuer = self.issuer()
+        credential = issuer.get_credential(self.badge_template.id)
+        first, second = issuer.bulk_issue_credential(credential, ["test_user", "other_user"])
+
+        with patch.object(
+            CredlyAPIClient,
+            "perform_request",
+            side_effect=[{"data": {"id": self.fake.uuid4(), "state": "issued"}}, RuntimeError("provider")],
+        ):
+            with patch.object(issuer, "_store_propagated", side_effect=DatabaseError("store")) as mock_store:
+                with self.assertRaisesMessage(RuntimeError, "provider"):
+                    issuer.propagate_badges([first, second])
+
+        mock_store.assert_called_once_with([first])
+
+    def test_award_defers_credly_badge_issuing_until_commit(self):
+        with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded"):
+            with mock.patch.object(self.issuer, "issue_credly_badge") as mock_issue_credly_badge:
+                with self.captureOnCommitCallbacks() as callbacks:
+                    self.issuer().award(credential_id=self.badge_template.id, username="test_user")
+
+                mock_issue_credly_badge.assert_not_called()
+
+                for callback in callbacks:
+                    callback()
+                mock_issue_credly_badge.assert_called_once()
+
     @patch.object(CredlyAPIClient, "perform_request", _perform_request)
     def test_issue_credly_badge(self):
         # Create a test user credential
@@ -157,7 +396,7 @@ class CredlyBadgeTemplateIssuerTestCase(TestCase):
 
         mock_revoke_badge.return_value = {"data": {"state": "revoked"}}
 
-        self.issuer().revoke_credly_badge(self.badge_template.id, user_credential)
+        self.issuer().revoke_credly_badge(user_credential)
 
         user_credential.refresh_from_db()
         self.assertEqual(user_credential.state, "revoked")
@@ -174,7 +413,7 @@ class CredlyBadgeTemplateIssuerTestCase(TestCase):
         )
 
         with self.assertRaises(BadgeProviderError):
-            self.issuer().revoke_credly_badge(self.badge_template.id, user_credential)
+            self.issuer().revoke_credly_badge(user_credential)
 
         user_credential.refresh_from_db()
         self.assertEqual(user_credential.state, "error")
@@ -206,7 +445,8 @@ class AccredibleBadgeTemplateIssuerTestCase(TestCase):
     def test_create_user_credential_awarded(self):
         with mock.patch("credentials.apps.badges.issuers.notify_badge_awarded") as mock_notify_badge_awarded:
             with mock.patch.object(self.issuer, "issue_accredible_badge") as mock_issue_accredible_badge:
-                self.issuer().award(credential_id=self.group.id, username="test_user")
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.issuer().award(credential_id=self.group.id, username="test_user")
 
             mock_notify_badge_awarded.assert_called_once()
             mock_issue_accredible_badge.assert_called_once()
@@ -231,7 +471,8 @@ class AccredibleBadgeTemplateIssuerTestCase(TestCase):
 
         with mock.patch("credentials.apps.badges.issuers.notify_badge_revoked") as mock_notify_badge_revoked:
             with mock.patch.object(self.issuer, "revoke_accredible_badge") as mock_revoke_accredible_badge:
-                self.issuer().revoke(self.group.id, "test_user")
+                with self.captureOnCommitCallbacks(execute=True):
+                    self.issuer().revoke(self.group.id, "test_user")
 
             mock_revoke_accredible_badge.assert_called_once()
             mock_notify_badge_revoked.assert_called_once()
@@ -245,6 +486,25 @@ class AccredibleBadgeTemplateIssuerTestCase(TestCase):
                 ).exists()
             )
 
+    def test_build_payload_matches_badge_data(self):
+        user = User.objects.get(username="test_user")
+        issued_on = _format_datetime(self.group.created)
+
+        badge_data = AccredibleBadgeData(
+            credential=AccredibleCredential(
+                recipient=AccredibleRecipient(name=user.get_full_name() or user.username, email=user.email),
+                group_id=self.group.id,
+                name=self.group.name,
+                issued_on=issued_on,
+                complete=True,
+            )
+        )
+
+        self.assertEqual(
+            AccredibleBadgeData.build_payload(user=user, group=self.group, issued_on=issued_on),
+            asdict(badge_data),
+        )
+
     @patch.object(AccredibleAPIClient, "perform_request", _perform_request)
     def test_issue_accredible_badge(self):
         user_credential = self.issued_user_credential_type.objects.create(
@@ -300,7 +560,7 @@ class AccredibleBadgeTemplateIssuerTestCase(TestCase):
 
         mock_revoke_badge.return_value = {"credential": {"id": 123}}
 
-        self.issuer().revoke_accredible_badge(self.group.id, user_credential)
+        self.issuer().revoke_accredible_badge(user_credential)
 
         user_credential.refresh_from_db()
         self.assertEqual(user_credential.state, "expired")
@@ -317,7 +577,7 @@ class AccredibleBadgeTemplateIssuerTestCase(TestCase):
         )
 
         with self.assertRaises(BadgeProviderError):
-            self.issuer().revoke_accredible_badge(self.group.id, user_credential)
+            self.issuer().revoke_accredible_badge(user_credential)
 
         user_credential.refresh_from_db()
         self.assertEqual(user_credential.state, "error")
@@ -30,6 +30,19 @@ def get_user_by_username(username):
         return None
 
 
+def get_users_by_usernames(usernames):
+    """
+    Utility function that retrieves User instances for the given usernames with a single query.
+
+    Args:
+        usernames (Iterable[String]): The usernames of the User instances we are trying to retrieve
+
+    Returns:
+        A dict mapping each found username to its User instance. Usernames without an associated learner are omitted.
+    """
+    return User.objects.in_bulk(set(usernames), field_name="username")
+
+
 def get_or_create_user_from_event_data(user_data):
     """
     Utility function to retrieve a User instance while processing event bus events. If the user does not exist, we will
@@ -7,7 +7,11 @@ from django.test import TestCase
 from openedx_events.learning.data import UserData, UserPersonalData
 from testfixtures import LogCapture
 
-from credentials.apps.core.api import get_or_create_user_from_event_data, get_user_by_username
+from credentials.apps.core.api import (
+    get_or_create_user_from_event_data,
+    get_user_by_username,
+    get_users_by_usernames,
+)
 from credentials.apps.core.tests.factories import UserFactory
 
 
@@ -27,6 +31,13 @@ class CoreApiTests(TestCase):
         retrieved_user = get_user_by_username("mistadobalina")
         assert retrieved_user is None
 
+    def test_get_users_by_usernames(self):
+        user = UserFactory()
+
+        retrieved_users = get_users_by_usernames([user.username, "mistadobalina"])
+        assert list(retrieved_users) == [user.username]
+        assert retrieved_users[user.username].id == user.id
+
     def test_get_existing_user_from_event_data(self):
         """
         Test case to verify the behavior of the `get_or_create_user_from_event_bus_data` function when trying to